@@ -145,6 +145,8 @@ class BaseTemplateProcessor(object):
     """
 
     engine: Optional[str] = None
+    # The sandbox holds no per-database state, it is built once and shared
+    env = SandboxedEnvironment()
 
     def __init__(self, database=None, query=None, table=None, **kwargs):
         self.database = database
@@ -165,7 +167,6 @@ class BaseTemplateProcessor(object):
         self.context.update(BASE_CONTEXT)
         if self.engine:
             self.context[self.engine] = self
-        self.env = SandboxedEnvironment()
 
     def process_template(self, sql: str, **kwargs) -> str:
         """Processes a sql template
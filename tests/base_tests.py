@@ -36,9 +36,20 @@ BASE_DIR = app.config.get("BASE_DIR")
 class SupersetTestCase(unittest.TestCase):
     def __init__(self, *args, **kwargs):
         super(SupersetTestCase, self).__init__(*args, **kwargs)
-        self.client = app.test_client()
+        self._client = None
         self.maxDiff = None
 
+    @property
+    def client(self):
+        """Test client, only built for the tests that aren't handed one"""
+        if self._client is None:
+            self._client = app.test_client()
+        return self._client
+
+    @client.setter
+    def client(self, client):
+        self._client = client
+
     @classmethod
     def create_druid_test_objects(cls):
         # create druid cluster and druid datasources
@@ -85,6 +96,31 @@ class SupersetTestCase(unittest.TestCase):
         resp = self.get_resp("/login/", data=dict(username=username, password=password))
         self.assertNotIn("User confirmation needed", resp)
 
+    @staticmethod
+    def get_login_cookie(username="admin", password="general"):
+        """Logs in through a throwaway client and returns the session cookie"""
+        client = app.test_client()
+        resp = client.post(
+            "/login/",
+            data=dict(username=username, password=password),
+            follow_redirects=True,
+        )
+        # A failed login flashes a message, which still sends a session cookie
+        if "User confirmation needed" in resp.data.decode("utf-8"):
+            raise Exception("login failed for user {}".format(username))
+        cookies = [
+            cookie.value
+            for cookie in client.cookie_jar
+            if cookie.name == app.session_cookie_name
+        ]
+        if not cookies:
+            raise Exception("no session cookie set for user {}".format(username))
+        return cookies[0]
+
+    @staticmethod
+    def set_login_cookie(client, cookie):
+        client.set_cookie("localhost", app.session_cookie_name, cookie)
+
     def get_slice(self, slice_name, session):
         slc = session.query(models.Slice).filter_by(slice_name=slice_name).one()
         session.expunge_all()
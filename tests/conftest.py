@@ -0,0 +1,179 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+"""Shared pytest configuration and fixtures for the Superset test suite"""
+import os
+import shutil
+
+from flask_migrate import upgrade
+import pytest
+from sqlalchemy import event
+from sqlalchemy.engine.url import make_url
+
+from superset import app, appbuilder, db, examples, security_manager
+from superset.cli import load_test_users_run
+from superset.connectors.sqla.models import SqlaTable
+from superset.models import core as models
+from superset.utils import core as utils
+
+
+def bootstrap_database():
+    """Equivalent of `superset db upgrade`, `superset init` and the example
+    loading done by `tests/load_examples_test.py`"""
+    with app.app_context():
+        upgrade()
+    utils.get_or_create_main_db()
+    utils.get_example_database()
+    appbuilder.add_permissions(update_perms=True)
+    security_manager.sync_role_definitions()
+
+    if db.session.query(models.Slice).filter_by(slice_name="Girls").first():
+        return
+    examples.load_css_templates()
+    examples.load_energy()
+    examples.load_world_bank_health_n_pop()
+    examples.load_birth_names()
+    load_test_users_run()
+    examples.load_unicode_test_data()
+
+
+def copy_serial_database(worker_id):
+    """Copies the sqlite database tox prepared for serial runs to the worker's
+    own file, returns False when there is none to copy"""
+    worker_db = make_url(app.config.get("SQLALCHEMY_DATABASE_URI")).database
+    # Undo the "_<worker id>" suffix superset_test_config.py adds
+    root, ext = os.path.splitext(worker_db)
+    serial_db = root[: -len(worker_id) - 1] + ext
+    if not os.path.exists(serial_db):
+        return False
+    # Importing superset already opened the worker's file, close it before it
+    # gets replaced
+    db.session.remove()
+    db.engine.dispose()
+    shutil.copyfile(serial_db, worker_db)
+    # The copied "main" and "examples" databases still point at the serial file
+    utils.get_or_create_main_db()
+    utils.get_example_database()
+    return True
+
+
+def pytest_configure(config):
+    uri = app.config.get("SQLALCHEMY_DATABASE_URI")
+    if not hasattr(config, "workerinput"):
+        # Only sqlite gets a database per worker (see superset_test_config.py),
+        # workers sharing a mysql or postgres one would wipe each other's rows
+        if config.getoption("numprocesses", None) and not uri.startswith("sqlite"):
+            raise pytest.UsageError(
+                "pytest-xdist is only supported with a sqlite "
+                "SQLALCHEMY_DATABASE_URI, run without -n against {}".format(
+                    uri.split(":", 1)[0]
+                )
+            )
+        # Serial runs get their metadata database prepared by tox before
+        # pytest is invoked
+        return
+    # Each worker only ever writes its own file, copying needs no locking
+    if not copy_serial_database(config.workerinput["workerid"]):
+        bootstrap_database()
+
+
+@pytest.fixture(scope="session")
+def table_ids():
+    """Maps table names to ids, computed once per (xdist worker) session"""
+    return dict(db.session.query(SqlaTable.table_name, SqlaTable.id))
+
+
+@pytest.fixture(scope="session")
+def slice_ids():
+    """Maps slice names to ids, computed once per (xdist worker) session"""
+    return dict(db.session.query(models.Slice.slice_name, models.Slice.id))
+
+
+@pytest.fixture(scope="session")
+def main_db_id():
+    """Id of the "main" database, looked up once per (xdist worker) session"""
+    return utils.get_main_database().id
+
+
+@pytest.fixture(scope="session")
+def example_db_id():
+    """Id of the "examples" database, looked up once per (xdist worker) session"""
+    return utils.get_example_database().id
+
+
+@pytest.fixture(scope="session")
+def csv_upload_file(tmp_path_factory):
+    """A small `testCSV.csv` written once per session for the upload tests"""
+    path = tmp_path_factory.mktemp("csv") / "testCSV.csv"
+    path.write_text("a,b\njohn,1\npaul,2\n")
+    return path
+
+
+@pytest.fixture
+def db_session():
+    """Runs a test inside a transaction that is rolled back on teardown
+
+    ``db.session``, the security manager's session and the session of every
+    FAB view's datamodel are rebound to a single connection holding an open
+    transaction. Each session the scoped factory hands out works inside a
+    SAVEPOINT that is restarted whenever it ends, so commits and rollbacks
+    issued by the test or the views it calls never reach that transaction.
+    """
+    connection = db.engine.connect()
+    is_sqlite = connection.dialect.name == "sqlite"
+    if is_sqlite:
+        # pysqlite's own transaction handling defeats SAVEPOINTs, see
+        # https://docs.sqlalchemy.org/en/13/dialects/sqlite.html#serializable-isolation-savepoints-transactional-ddl
+        connection.connection.connection.isolation_level = None
+        event.listen(connection, "begin", lambda conn: conn.execute("BEGIN"))
+    transaction = connection.begin()
+
+    session = db.create_scoped_session(options={"bind": connection, "binds": {}})
+
+    # Flask-SQLAlchemy removes the session when a request's app context is torn
+    # down, the sessions created after that need a SAVEPOINT of their own
+    @event.listens_for(session, "after_begin")
+    def begin_savepoint(sess, trans, conn):
+        if trans._parent is None and sess.transaction is trans:
+            sess.begin_nested()
+
+    @event.listens_for(session, "after_transaction_end")
+    def restart_savepoint(sess, trans):
+        if trans.nested and not trans._parent.nested:
+            sess.expire_all()
+            sess.begin_nested()
+
+    datamodels = {
+        view.datamodel
+        for view in appbuilder.baseviews
+        if hasattr(getattr(view, "datamodel", None), "session")
+    }
+    orig_sessions = {datamodel: datamodel.session for datamodel in datamodels}
+    orig_session = db.session
+    db.session = appbuilder.session = session
+    for datamodel in datamodels:
+        datamodel.session = session
+    try:
+        yield session
+    finally:
+        for datamodel, datamodel_session in orig_sessions.items():
+            datamodel.session = datamodel_session
+        db.session = appbuilder.session = orig_session
+        session.remove()
+        transaction.rollback()
+        if is_sqlite:
+            connection.connection.connection.isolation_level = ""
+        connection.close()
@@ -28,6 +28,13 @@ SUPERSET_WEBSERVER_PORT = 8081
 if "SUPERSET__SQLALCHEMY_DATABASE_URI" in os.environ:
     SQLALCHEMY_DATABASE_URI = os.environ.get("SUPERSET__SQLALCHEMY_DATABASE_URI")
 
+# When running under pytest-xdist, give each worker its own sqlite file so the
+# workers don't contend on (or clobber) a single metadata database
+xdist_worker = os.environ.get("PYTEST_XDIST_WORKER")
+if xdist_worker and SQLALCHEMY_DATABASE_URI.startswith("sqlite"):
+    uri_root, uri_ext = os.path.splitext(SQLALCHEMY_DATABASE_URI)
+    SQLALCHEMY_DATABASE_URI = f"{uri_root}_{xdist_worker}{uri_ext}"
+
 SQL_SELECT_AS_CTA = True
 SQL_MAX_ROW = 666
 FEATURE_FLAGS = {"foo": "bar"}